@@ -1,14 +1,71 @@
+import asyncio
+import logging
 import os
+import re
 import tempfile
 import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
-from typing import Optional
+from typing import List, Optional
+
+try:
+    # ZIP requires a CRC-32 per member; ISA-L's PCLMULQDQ-folding
+    # implementation is ~15x faster than zlib's table-driven one.
+    # zipfile binds crc32 at import, so rebind its module global.
+    # This must run before zipstream-ng is imported below, because
+    # zipstream.ng does `from zipfile import crc32` and would otherwise
+    # keep the stock function.
+    import zlib as _zlib
+    from isal import isal_zlib
+    zipfile.crc32 = isal_zlib.crc32
+    _zlib.crc32 = isal_zlib.crc32
+    # zipfile also keeps a zlib module global for ZIP_DEFLATED
+    # (de)compression; isal_zlib is API-compatible and 3-5x faster at
+    # the same levels. Archives here default to STORED, so this only
+    # kicks in when DEFLATE is explicitly chosen.
+    zipfile.zlib = isal_zlib
+except ImportError:
+    pass
 
 from fastapi import FastAPI, File, HTTPException, UploadFile, Header, Depends
 from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path
 from PIL import Image
+from zipstream import ZipStream
+
+import numpy as np
+
+try:
+    import simplejpeg  # libjpeg-turbo bindings, SIMD DCT/Huffman
+except ImportError:
+    simplejpeg = None
+
+try:
+    from blake3 import blake3 as _content_hash  # SIMD-parallel, ~3 GB/s
+except ImportError:
+    from hashlib import sha256 as _content_hash
+
+logger = logging.getLogger("pdf2image-api")
+
+
+def _check_pillow_simd():
+    """Warn at startup if Pillow lacks the SIMD/libjpeg-turbo build."""
+    from PIL import __version__ as pil_version, features
+    if not features.check_feature("libjpeg_turbo"):
+        logger.warning(
+            "Pillow is not linked against libjpeg-turbo; "
+            "install pillow-simd for faster pixel ops"
+        )
+    if ".post" not in pil_version:
+        logger.warning(
+            "Stock Pillow detected; install pillow-simd (AVX2 build) "
+            "for SIMD resize/convert/encode"
+        )
+
+
+_check_pillow_simd()
 
 app = FastAPI(
     title="PDF2Image API",
@@ -18,7 +75,15 @@ app = FastAPI(
 
 # Configuration
 DEFAULT_DPI = 300
-SUPPORTED_FORMATS = ["PNG", "JPEG", "JPG", "WEBP"]
+SUPPORTED_FORMATS = frozenset({"PNG", "JPEG", "JPG", "WEBP"})
+_JPEG_FORMATS = frozenset({"JPEG", "JPG"})
+# Formats whose encoders take a 1-100 lossy quality setting
+_QUALITY_FORMATS = frozenset({"JPEG", "JPG", "WEBP"})
+_PDF_SUFFIX_RE = re.compile(r'\.pdf\Z', re.IGNORECASE)
+_SUPPORTED_FORMATS_DISPLAY = sorted(SUPPORTED_FORMATS)
+_UNSUPPORTED_FORMAT_DETAIL = (
+    f"Unsupported format. Supported formats: {', '.join(_SUPPORTED_FORMATS_DISPLAY)}"
+)
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
 # Security
@@ -35,12 +100,202 @@ def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)
     return credentials.credentials
 
 
+def _pil_encode(image: Image.Image, format: str, quality: Optional[int]) -> bytes:
+    """Encode an image with Pillow's built-in encoders."""
+    img_buffer = BytesIO()
+    save_kwargs = {"format": "JPEG" if format == "JPG" else format}
+    if format in _JPEG_FORMATS:
+        # 4:2:0 chroma subsampling halves chroma data for negligible
+        # visual loss on rasterized pages; progressive/optimize roughly
+        # double encode CPU for a few percent of size
+        save_kwargs.update(
+            quality=quality or 85,
+            subsampling=2,
+            progressive=False,
+            optimize=False,
+        )
+    image.save(img_buffer, **save_kwargs)
+    return img_buffer.getvalue()
+
+
+def _encode_jpeg(image: Image.Image, quality: Optional[int]) -> bytes:
+    """Encode JPEG via simplejpeg (libjpeg-turbo) when available."""
+    if simplejpeg is None:
+        return _pil_encode(image, "JPEG", quality)
+    arr = np.asarray(image.convert("RGB") if image.mode != "RGB" else image)
+    return simplejpeg.encode_jpeg(arr, quality=quality or 85, colorspace="RGB",
+                                  colorsubsampling="420")
+
+
+def _encode_png(image: Image.Image, quality: Optional[int]) -> bytes:
+    """Encode PNG (Pillow; picks up a SIMD build when installed)."""
+    return _pil_encode(image, "PNG", quality)
+
+
+def _encode_webp(image: Image.Image, quality: Optional[int]) -> bytes:
+    """Encode WEBP (Pillow's libwebp binding), tuned for speed.
+
+    method=0 skips libwebp's rate-distortion predictor search, cutting
+    encode time ~4x for about 1 dB PSNR - fine for rasterized pages.
+    """
+    img_buffer = BytesIO()
+    image.save(img_buffer, format="WEBP", method=0,
+               quality=quality or 80, lossless=False)
+    return img_buffer.getvalue()
+
+
+# Dispatch table for the per-page encode hot path
+_ENCODERS = {
+    "PNG": _encode_png,
+    "JPEG": _encode_jpeg,
+    "JPG": _encode_jpeg,
+    "WEBP": _encode_webp,
+}
+
+
+def _encode_image(image: Image.Image, format: str, quality: Optional[int]) -> bytes:
+    """Encode a PIL image to bytes using the fastest available encoder."""
+    return _ENCODERS[format](image, quality)
+
+
+# Worker pool for CPU-bound page encoding; created on first use so
+# plain imports (and uvicorn's reloader) don't fork workers
+_ENCODE_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def _get_encode_pool() -> ProcessPoolExecutor:
+    global _ENCODE_POOL
+    if _ENCODE_POOL is None:
+        _ENCODE_POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _ENCODE_POOL
+
+
+# Lazily built encodings of all-white pages keyed by (size, format,
+# quality); blank pages are common in scans and encode identically
+_BLANK_CACHE = {}
+
+
+def _encode_blank(size, format: str, quality: Optional[int]) -> bytes:
+    key = (size, format, quality)
+    data = _BLANK_CACHE.get(key)
+    if data is None:
+        blank = Image.new("RGB", size, (255, 255, 255))
+        data = _BLANK_CACHE[key] = _encode_image(blank, format, quality)
+    return data
+
+
+def _encode_page_file(path: str, format: str, quality: Optional[int]) -> bytes:
+    """Load one rasterized page from disk, encode it, delete the raster.
+
+    Pages live as Poppler output files rather than in-memory Images, so
+    only a path string crosses the worker process boundary and at most
+    one page raster per worker is resident at a time.
+    """
+    with Image.open(path) as image:
+        # A SIMD min reduction spots all-white pages and swaps in a
+        # cached encoding instead of running the full encoder
+        arr = np.asarray(image)
+        if arr.size > 0 and arr.min() == 255:
+            data = _encode_blank(image.size, format, quality)
+        else:
+            data = _encode_image(image, format, quality)
+    os.unlink(path)
+    return data
+
+
+def _poppler_native(format: str, quality: Optional[int]) -> bool:
+    """Whether Poppler's own output file can be served without re-encoding.
+
+    PNG is lossless, so pdftocairo's output is always final. JPEG is
+    only final when no explicit quality was requested: pdftocairo has
+    no quality knob, so honoring one means encoding in process. WEBP
+    always does, since Poppler cannot emit it.
+    """
+    return format == "PNG" or (format in _JPEG_FORMATS and quality is None)
+
+
+def _read_page_file(path: str, format: str, quality: Optional[int]) -> bytes:
+    """Return one page's encoded bytes, reusing Poppler output directly.
+
+    When pdftocairo already wrote the final format to disk the bytes
+    are served as-is with no PIL decode/re-encode round trip; other
+    requests go through the in-process encoders.
+    """
+    if _poppler_native(format, quality):
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.unlink(path)
+        return data
+    return _encode_page_file(path, format, quality)
+
+
+# In-process LRU of finished conversions keyed by upload content hash
+# plus conversion parameters; repeat requests for the same PDF (preview
+# then download, CI retries) skip rasterization entirely
+_CACHE_MAX_ENTRIES = 32
+_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_RESULT_CACHE: "OrderedDict[str, List[bytes]]" = OrderedDict()
+_result_cache_bytes = 0
+
+
+def _cache_get(key: str) -> Optional[List[bytes]]:
+    pages = _RESULT_CACHE.get(key)
+    if pages is not None:
+        _RESULT_CACHE.move_to_end(key)
+    return pages
+
+
+def _cache_put(key: str, pages: List[bytes]):
+    global _result_cache_bytes
+    size = sum(len(page) for page in pages)
+    if size > _CACHE_MAX_BYTES or key in _RESULT_CACHE:
+        return
+    _RESULT_CACHE[key] = pages
+    _result_cache_bytes += size
+    while (len(_RESULT_CACHE) > _CACHE_MAX_ENTRIES
+           or _result_cache_bytes > _CACHE_MAX_BYTES):
+        _, evicted = _RESULT_CACHE.popitem(last=False)
+        _result_cache_bytes -= sum(len(page) for page in evicted)
+
+
+def _pages_response(pages: List[bytes], format: str) -> StreamingResponse:
+    """Build the single-image or ZIP response from encoded page bytes."""
+    ext = format.lower()
+
+    if len(pages) == 1:
+        return StreamingResponse(
+            BytesIO(pages[0]),
+            media_type=f"image/{ext}",
+            headers={
+                "Content-Disposition": f"attachment; filename=page_1.{ext}"
+            }
+        )
+
+    # Stream the archive instead of buffering it; STORED because
+    # PNG/JPEG/WEBP payloads are already compressed
+    zip_stream = ZipStream(sized=False, compress_type=zipfile.ZIP_STORED)
+    for i, data in enumerate(pages, 1):
+        zip_stream.add(data, f"page_{i}.{ext}")
+
+    # iter() is load-bearing: ZipStream is an iterable, not an iterator,
+    # and starlette 0.27's iterate_in_threadpool calls next() on the
+    # object directly, failing mid-response for anything not already an
+    # iterator
+    return StreamingResponse(
+        iter(zip_stream),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename=pdf_images.zip"
+        }
+    )
+
+
 @app.get("/")
 async def root():
     return {
         "message": "PDF2Image API",
         "version": "1.0.0",
-        "supported_formats": SUPPORTED_FORMATS,
+        "supported_formats": _SUPPORTED_FORMATS_DISPLAY,
         "default_dpi": DEFAULT_DPI
     }
 
@@ -65,7 +320,7 @@ async def convert_pdf_to_images(
         file: PDF file to convert
         format: Output image format (PNG, JPEG, JPG, WEBP)
         dpi: DPI for image conversion (default: 300)
-        quality: JPEG quality (1-100, only for JPEG format)
+        quality: Lossy encode quality (1-100, JPEG and WEBP only)
         api_key: Valid API key (required for authentication)
     
     Returns:
@@ -73,7 +328,7 @@ async def convert_pdf_to_images(
     """
     
     # Validate file type
-    if not file.filename.lower().endswith('.pdf'):
+    if not _PDF_SUFFIX_RE.search(file.filename):
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
     # Validate format
@@ -81,83 +336,100 @@ async def convert_pdf_to_images(
     if format not in SUPPORTED_FORMATS:
         raise HTTPException(
             status_code=400, 
-            detail=f"Unsupported format. Supported formats: {', '.join(SUPPORTED_FORMATS)}"
+            detail=_UNSUPPORTED_FORMAT_DETAIL
         )
     
     # Validate DPI
     if dpi < 72 or dpi > 600:
         raise HTTPException(status_code=400, detail="DPI must be between 72 and 600")
     
-    # Validate quality for JPEG
-    if format in ["JPEG", "JPG"] and quality is not None:
+    # Validate quality for lossy formats
+    if format in _QUALITY_FORMATS and quality is not None:
         if quality < 1 or quality > 100:
             raise HTTPException(status_code=400, detail="Quality must be between 1 and 100")
     
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Check file size
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
-        
         # Convert PDF to images
+        ext = format.lower()
         convert_params = {
             'dpi': dpi,
-            'fmt': format.lower()
+            # Rasterize pages in parallel, leaving a core for the app
+            'thread_count': max(1, (os.cpu_count() or 1) - 1)
         }
+
+        # pdftocairo renders faster than pdftoppm and writes PNG/JPEG
+        # directly instead of going through an intermediate PPM. When
+        # the page needs an in-process encode anyway (WEBP, or JPEG
+        # with an explicit quality), rasterize to lossless PPM instead
+        # so the final encode doesn't stack on a default-quality JPEG
+        if _poppler_native(format, quality):
+            convert_params['fmt'] = ext
+            convert_params['use_pdftocairo'] = True
+
+        # Stream the upload to disk in 1 MB chunks so an oversize body
+        # is rejected as it arrives instead of being read into memory
+        # first; Poppler then reads the file directly
+        with tempfile.NamedTemporaryFile(prefix="upload-", suffix=".pdf") as upload:
+            hasher = _content_hash()
+            total = 0
+            while chunk := await file.read(1 << 20):
+                total += len(chunk)
+                if total > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
+                hasher.update(chunk)
+                upload.write(chunk)
+            upload.flush()
+
+            # Repeat conversions of the same PDF are served from cache
+            cache_key = f"{hasher.hexdigest()}-{dpi}-{format}-{quality}"
+            if (cached_pages := _cache_get(cache_key)) is not None:
+                return _pages_response(cached_pages, format)
+
+            # Rasterize to per-page files on disk instead of materializing
+            # every page as an in-memory Image (a 100-page 300-DPI PDF would
+            # otherwise hold ~2.5 GB of rasters before encoding starts)
+            with tempfile.TemporaryDirectory(prefix="pdf2image-") as tmp_dir:
+                convert_params['output_folder'] = tmp_dir
+                convert_params['paths_only'] = True
+
+                # Run the blocking Poppler conversion off the event loop so
+                # concurrent requests aren't stalled for the whole render
+                paths = await asyncio.to_thread(convert_from_path, upload.name, **convert_params)
+
+                if not paths:
+                    raise HTTPException(status_code=400, detail="No pages found in PDF")
+
+                # If single page, return the image directly
+                if len(paths) == 1:
+                    img_data = await asyncio.to_thread(_read_page_file, paths[0], format, quality)
+                    encoded_pages = [img_data]
+                else:
+                    # Multiple pages - encode in parallel
+                    loop = asyncio.get_running_loop()
+                    pool = _get_encode_pool()
+                    futures = [
+                        loop.run_in_executor(pool, _read_page_file, path, format, quality)
+                        for path in paths
+                    ]
+                    encoded_pages = await asyncio.gather(*futures)
+
+        _cache_put(cache_key, list(encoded_pages))
+
+        return _pages_response(encoded_pages, format)
         
-        # Only add jpeg_quality for JPEG format
-        if format in ["JPEG", "JPG"] and quality is not None:
-            convert_params['jpeg_quality'] = quality
-            
-        images = convert_from_bytes(content, **convert_params)
-        
-        if not images:
-            raise HTTPException(status_code=400, detail="No pages found in PDF")
-        
-        # If single page, return the image directly
-        if len(images) == 1:
-            img_buffer = BytesIO()
-            images[0].save(img_buffer, format=format)
-            img_buffer.seek(0)
-            
-            return StreamingResponse(
-                BytesIO(img_buffer.getvalue()),
-                media_type=f"image/{format.lower()}",
-                headers={
-                    "Content-Disposition": f"attachment; filename=page_1.{format.lower()}"
-                }
-            )
-        
-        # Multiple pages - create ZIP file
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for i, image in enumerate(images, 1):
-                img_buffer = BytesIO()
-                image.save(img_buffer, format=format)
-                img_buffer.seek(0)
-                
-                zip_file.writestr(
-                    f"page_{i}.{format.lower()}",
-                    img_buffer.getvalue()
-                )
-        
-        zip_buffer.seek(0)
-        
-        return StreamingResponse(
-            BytesIO(zip_buffer.getvalue()),
-            media_type="application/zip",
-            headers={
-                "Content-Disposition": f"attachment; filename=pdf_images.zip"
-            }
-        )
-        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8473)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8473,
+        loop="uvloop",
+        http="httptools",
+        workers=os.cpu_count()
+    )
@@ -1,8 +1,13 @@
 """
 Serverless version of the PDF2Image API using AWS Lambda
 """
+import asyncio
 import json
 import base64
+import logging
+import os
+import re
+import shutil
 import tempfile
 import zipfile
 from io import BytesIO
@@ -10,28 +15,232 @@ from typing import Optional, Dict, Any
 
 from fastapi import FastAPI, HTTPException, UploadFile, File
 from fastapi.responses import StreamingResponse
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_bytes, convert_from_path
 from PIL import Image
 from mangum import Mangum
 
+import numpy as np
+
+try:
+    import simplejpeg  # libjpeg-turbo bindings, SIMD DCT/Huffman
+except ImportError:
+    simplejpeg = None
+
+logger = logging.getLogger("pdf2image-api")
+
+try:
+    # ZIP requires a CRC-32 per member; ISA-L's PCLMULQDQ-folding
+    # implementation is ~15x faster than zlib's table-driven one.
+    # zipfile binds crc32 at import, so rebind its module global.
+    import zlib as _zlib
+    from isal import isal_zlib
+    zipfile.crc32 = isal_zlib.crc32
+    _zlib.crc32 = isal_zlib.crc32
+    # zipfile also keeps a zlib module global for ZIP_DEFLATED
+    # (de)compression; isal_zlib is API-compatible and 3-5x faster at
+    # the same levels. Archives here default to STORED, so this only
+    # kicks in when DEFLATE is explicitly chosen.
+    zipfile.zlib = isal_zlib
+except ImportError:
+    pass
+
+
+def _check_pillow_simd():
+    """Warn at startup if Pillow lacks the SIMD/libjpeg-turbo build."""
+    from PIL import __version__ as pil_version, features
+    if not features.check_feature("libjpeg_turbo"):
+        logger.warning(
+            "Pillow is not linked against libjpeg-turbo; "
+            "install pillow-simd for faster pixel ops"
+        )
+    if ".post" not in pil_version:
+        logger.warning(
+            "Stock Pillow detected; install pillow-simd (AVX2 build) "
+            "for SIMD resize/convert/encode"
+        )
+
+
+_check_pillow_simd()
+
 app = FastAPI(
     title="PDF2Image API",
     description="Convert PDF files to images with high DPI support",
     version="1.0.0"
 )
 
+# Minimal one-page blank PDF used to warm Poppler at import time
+_WARMUP_PDF_B64 = (
+    "JVBERi0xLjQKMSAwIG9iago8PC9UeXBlL0NhdGFsb2cvUGFnZXMgMiAwIFI+PgplbmRvYmoK"
+    "MiAwIG9iago8PC9UeXBlL1BhZ2VzL0tpZHNbMyAwIFJdL0NvdW50IDE+PgplbmRvYmoKMyAw"
+    "IG9iago8PC9UeXBlL1BhZ2UvUGFyZW50IDIgMCBSL01lZGlhQm94WzAgMCA3MiA3Ml0+Pgpl"
+    "bmRvYmoKeHJlZgowIDQKMDAwMDAwMDAwMCA2NTUzNSBmIAowMDAwMDAwMDA5IDAwMDAwIG4g"
+    "CjAwMDAwMDAwNTQgMDAwMDAgbiAKMDAwMDAwMDEwNSAwMDAwMCBuIAp0cmFpbGVyCjw8L1Np"
+    "emUgNC9Sb290IDEgMCBSPj4Kc3RhcnR4cmVmCjE2OAolJUVPRgo="
+)
+
+# Render the tiny PDF once per cold start so pdftoppm/pdftocairo and
+# libpoppler are dlopen'ed and resident in the page cache before the
+# first real invocation; saves ~300-600 ms of first-request latency
+try:
+    convert_from_bytes(base64.b64decode(_WARMUP_PDF_B64), dpi=72)
+except Exception:
+    logger.warning("Poppler warm-up render failed", exc_info=True)
+
 # Configuration
 DEFAULT_DPI = 300
-SUPPORTED_FORMATS = ["PNG", "JPEG", "JPG", "WEBP"]
+SUPPORTED_FORMATS = frozenset({"PNG", "JPEG", "JPG", "WEBP"})
+_JPEG_FORMATS = frozenset({"JPEG", "JPG"})
+# Formats whose encoders take a 1-100 lossy quality setting
+_QUALITY_FORMATS = frozenset({"JPEG", "JPG", "WEBP"})
+_PDF_SUFFIX_RE = re.compile(r'\.pdf\Z', re.IGNORECASE)
+_SUPPORTED_FORMATS_DISPLAY = sorted(SUPPORTED_FORMATS)
+_UNSUPPORTED_FORMAT_DETAIL = (
+    f"Unsupported format. Supported formats: {', '.join(_SUPPORTED_FORMATS_DISPLAY)}"
+)
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
 
 
+def _pil_encode(image: Image.Image, format: str, quality: Optional[int]) -> bytes:
+    """Encode an image with Pillow's built-in encoders."""
+    img_buffer = BytesIO()
+    save_kwargs = {"format": "JPEG" if format == "JPG" else format}
+    if format in _JPEG_FORMATS:
+        # 4:2:0 chroma subsampling halves chroma data for negligible
+        # visual loss on rasterized pages; progressive/optimize roughly
+        # double encode CPU for a few percent of size
+        save_kwargs.update(
+            quality=quality or 85,
+            subsampling=2,
+            progressive=False,
+            optimize=False,
+        )
+    image.save(img_buffer, **save_kwargs)
+    return img_buffer.getvalue()
+
+
+def _encode_jpeg(image: Image.Image, quality: Optional[int]) -> bytes:
+    """Encode JPEG via simplejpeg (libjpeg-turbo) when available."""
+    if simplejpeg is None:
+        return _pil_encode(image, "JPEG", quality)
+    arr = np.asarray(image.convert("RGB") if image.mode != "RGB" else image)
+    return simplejpeg.encode_jpeg(arr, quality=quality or 85, colorspace="RGB",
+                                  colorsubsampling="420")
+
+
+def _encode_png(image: Image.Image, quality: Optional[int]) -> bytes:
+    """Encode PNG (Pillow; picks up a SIMD build when installed)."""
+    return _pil_encode(image, "PNG", quality)
+
+
+def _encode_webp(image: Image.Image, quality: Optional[int]) -> bytes:
+    """Encode WEBP (Pillow's libwebp binding), tuned for speed.
+
+    method=0 skips libwebp's rate-distortion predictor search, cutting
+    encode time ~4x for about 1 dB PSNR - fine for rasterized pages.
+    """
+    img_buffer = BytesIO()
+    image.save(img_buffer, format="WEBP", method=0,
+               quality=quality or 80, lossless=False)
+    return img_buffer.getvalue()
+
+
+# Dispatch table for the per-page encode hot path
+_ENCODERS = {
+    "PNG": _encode_png,
+    "JPEG": _encode_jpeg,
+    "JPG": _encode_jpeg,
+    "WEBP": _encode_webp,
+}
+
+
+def _encode_image(image: Image.Image, format: str, quality: Optional[int]) -> bytes:
+    """Encode a PIL image to bytes using the fastest available encoder."""
+    return _ENCODERS[format](image, quality)
+
+
+# Lazily built encodings of all-white pages keyed by (size, format,
+# quality); blank pages are common in scans and encode identically
+_BLANK_CACHE = {}
+
+
+def _encode_blank(size, format: str, quality: Optional[int]) -> bytes:
+    key = (size, format, quality)
+    data = _BLANK_CACHE.get(key)
+    if data is None:
+        blank = Image.new("RGB", size, (255, 255, 255))
+        data = _BLANK_CACHE[key] = _encode_image(blank, format, quality)
+    return data
+
+
+def _encode_page_file(path: str, format: str, quality: Optional[int]) -> bytes:
+    """Load one rasterized page from disk, encode it, delete the raster."""
+    with Image.open(path) as image:
+        # A SIMD min reduction spots all-white pages and swaps in a
+        # cached encoding instead of running the full encoder
+        arr = np.asarray(image)
+        if arr.size > 0 and arr.min() == 255:
+            data = _encode_blank(image.size, format, quality)
+        else:
+            data = _encode_image(image, format, quality)
+    os.unlink(path)
+    return data
+
+
+def _poppler_native(format: str, quality: Optional[int]) -> bool:
+    """Whether Poppler's own output file can be served without re-encoding.
+
+    PNG is lossless, so pdftocairo's output is always final. JPEG is
+    only final when no explicit quality was requested: pdftocairo has
+    no quality knob, so honoring one means encoding in process. WEBP
+    always does, since Poppler cannot emit it.
+    """
+    return format == "PNG" or (format in _JPEG_FORMATS and quality is None)
+
+
+def _read_page_file(path: str, format: str, quality: Optional[int]) -> bytes:
+    """Return one page's encoded bytes, reusing Poppler output directly.
+
+    When pdftocairo already wrote the final format to disk the bytes
+    are served as-is with no PIL decode/re-encode round trip; other
+    requests go through the in-process encoders.
+    """
+    if _poppler_native(format, quality):
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.unlink(path)
+        return data
+    return _encode_page_file(path, format, quality)
+
+
+def _write_page_member(zip_file: zipfile.ZipFile, name: str, path: str,
+                       format: str, quality: Optional[int]):
+    """Write one page straight into a ZIP member stream.
+
+    Streaming into zip_file.open avoids materializing the page bytes
+    and the extra full-page copy writestr would make.
+    """
+    with zip_file.open(name, 'w', force_zip64=True) as member:
+        if _poppler_native(format, quality):
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, member, 1 << 20)
+        else:
+            with Image.open(path) as image:
+                # Same min reduction as _encode_page_file: all-white
+                # pages reuse a cached encoding instead of the encoder
+                arr = np.asarray(image)
+                if arr.size > 0 and arr.min() == 255:
+                    member.write(_encode_blank(image.size, format, quality))
+                else:
+                    member.write(_encode_image(image, format, quality))
+    os.unlink(path)
+
+
 @app.get("/")
 async def root():
     return {
         "message": "PDF2Image API",
         "version": "1.0.0",
-        "supported_formats": SUPPORTED_FORMATS,
+        "supported_formats": _SUPPORTED_FORMATS_DISPLAY,
         "default_dpi": DEFAULT_DPI
     }
 
@@ -55,14 +264,14 @@ async def convert_pdf_to_images(
         file: PDF file to convert
         format: Output image format (PNG, JPEG, JPG, WEBP)
         dpi: DPI for image conversion (default: 300)
-        quality: JPEG quality (1-100, only for JPEG format)
+        quality: Lossy encode quality (1-100, JPEG and WEBP only)
     
     Returns:
         Single image file or ZIP file containing multiple images
     """
     
     # Validate file type
-    if not file.filename.lower().endswith('.pdf'):
+    if not _PDF_SUFFIX_RE.search(file.filename):
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
     # Validate format
@@ -70,78 +279,108 @@ async def convert_pdf_to_images(
     if format not in SUPPORTED_FORMATS:
         raise HTTPException(
             status_code=400, 
-            detail=f"Unsupported format. Supported formats: {', '.join(SUPPORTED_FORMATS)}"
+            detail=_UNSUPPORTED_FORMAT_DETAIL
         )
     
     # Validate DPI
     if dpi < 72 or dpi > 600:
         raise HTTPException(status_code=400, detail="DPI must be between 72 and 600")
     
-    # Validate quality for JPEG
-    if format in ["JPEG", "JPG"] and quality is not None:
+    # Validate quality for lossy formats
+    if format in _QUALITY_FORMATS and quality is not None:
         if quality < 1 or quality > 100:
             raise HTTPException(status_code=400, detail="Quality must be between 1 and 100")
     
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Check file size
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
-        
         # Convert PDF to images
-        images = convert_from_bytes(
-            content,
-            dpi=dpi,
-            fmt=format.lower(),
-            jpeg_quality=quality if format in ["JPEG", "JPG"] else None
-        )
-        
-        if not images:
-            raise HTTPException(status_code=400, detail="No pages found in PDF")
-        
-        # If single page, return the image directly
-        if len(images) == 1:
-            img_buffer = BytesIO()
-            images[0].save(img_buffer, format=format)
-            img_buffer.seek(0)
-            
-            return StreamingResponse(
-                BytesIO(img_buffer.getvalue()),
-                media_type=f"image/{format.lower()}",
-                headers={
-                    "Content-Disposition": f"attachment; filename=page_1.{format.lower()}"
-                }
-            )
-        
-        # Multiple pages - create ZIP file
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for i, image in enumerate(images, 1):
-                img_buffer = BytesIO()
-                image.save(img_buffer, format=format)
-                img_buffer.seek(0)
-                
-                zip_file.writestr(
-                    f"page_{i}.{format.lower()}",
-                    img_buffer.getvalue()
-                )
+        ext = format.lower()
+        convert_params = {
+            'dpi': dpi,
+            # Rasterize pages in parallel, leaving a core for the app
+            'thread_count': max(1, (os.cpu_count() or 1) - 1)
+        }
+
+        # pdftocairo renders faster than pdftoppm and writes PNG/JPEG
+        # directly instead of going through an intermediate PPM. When
+        # the page needs an in-process encode anyway (WEBP, or JPEG
+        # with an explicit quality), rasterize to lossless PPM instead
+        # so the final encode doesn't stack on a default-quality JPEG
+        if _poppler_native(format, quality):
+            convert_params['fmt'] = ext
+            convert_params['use_pdftocairo'] = True
+
+        # Stream the upload to /tmp in 1 MB chunks so an oversize body
+        # is rejected as it arrives instead of being read into memory
+        # first; Poppler then reads the file directly
+        with tempfile.NamedTemporaryFile(prefix="upload-", suffix=".pdf") as upload:
+            total = 0
+            while chunk := await file.read(1 << 20):
+                total += len(chunk)
+                if total > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
+                upload.write(chunk)
+            upload.flush()
+
+            # Rasterize to per-page files in /tmp instead of materializing
+            # every page as an in-memory Image; encode one page at a time
+            with tempfile.TemporaryDirectory(prefix="pdf2image-") as tmp_dir:
+                convert_params['output_folder'] = tmp_dir
+                convert_params['paths_only'] = True
+
+                # Run the blocking Poppler conversion off the event loop so
+                # concurrent requests aren't stalled for the whole render
+                paths = await asyncio.to_thread(convert_from_path, upload.name, **convert_params)
+
+                if not paths:
+                    raise HTTPException(status_code=400, detail="No pages found in PDF")
+
+                # If single page, return the image directly
+                if len(paths) == 1:
+                    img_data = await asyncio.to_thread(_read_page_file, paths[0], format, quality)
+
+                    return StreamingResponse(
+                        BytesIO(img_data),
+                        media_type=f"image/{ext}",
+                        headers={
+                            "Content-Disposition": f"attachment; filename=page_1.{ext}"
+                        }
+                    )
+
+                # Multiple pages - create ZIP file
+                zip_buffer = BytesIO()
+
+                # STORED, not DEFLATED: the image payloads are already
+                # compressed, so re-deflating burns CPU for <1% size gain
+                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+                    for i, path in enumerate(paths, 1):
+                        await asyncio.to_thread(
+                            _write_page_member, zip_file,
+                            f"page_{i}.{ext}", path, format, quality
+                        )
         
         zip_buffer.seek(0)
-        
+
         return StreamingResponse(
-            BytesIO(zip_buffer.getvalue()),
+            zip_buffer,
             media_type="application/zip",
             headers={
                 "Content-Disposition": f"attachment; filename=pdf_images.zip"
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
+# Use libuv for the event loop when available; must be installed
+# before Mangum creates the loop
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
 # AWS Lambda handler
 handler = Mangum(app)